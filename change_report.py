@@ -0,0 +1,225 @@
+import datetime
+import os
+from decimal import Decimal
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from result_buffer import decode_strings, encode_strings, normalize_as_text
+
+# Key types recognised from the normalized key text, most specific first
+KEY_KINDS = (
+    ('integer', r'-?\d+'),
+    ('decimal', r'-?\d+(?:\.\d+)?'),
+    ('date', r'\d{4}-\d{2}-\d{2}'),
+    ('datetime', r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}(?:\.\d+)?'),
+)
+
+
+def hash_batch(batch):
+    """
+    Hashes one batch. Returns (keys, key_hashes, row_hashes): the first column
+    as normalized text, and uint64 hashes of the first column and of the row.
+    """
+    normalized = normalize_as_text(batch)
+    row_hashes = pd.util.hash_pandas_object(normalized, index=False).to_numpy(dtype=np.uint64)
+    key_hashes = pd.util.hash_pandas_object(normalized.iloc[:, 0], index=False).to_numpy(dtype=np.uint64)
+    return normalized.iloc[:, 0], key_hashes, row_hashes
+
+
+def restore_key(text, kind):
+    """Turns a normalized key back into a typed value for the report."""
+    if text == '':
+        return None
+    if kind == 'integer':
+        return int(text)
+    if kind == 'decimal':
+        return Decimal(text)
+    if kind == 'date':
+        return datetime.date.fromisoformat(text)
+    if kind == 'datetime':
+        return datetime.datetime.fromisoformat(text)
+    return text
+
+
+class RowHashIndexBuilder:
+    """
+    Collects key and row hashes batch by batch and saves them as a row-hash
+    index: hashes sorted for searchsorted lookups, plus the key text as one
+    UTF-8 blob with offsets and the key's type.
+    """
+
+    def __init__(self, key_name):
+        self.key_name = key_name
+        self.key_hashes = []
+        self.row_hashes = []
+        self.key_blobs = []
+        self.key_lengths = []
+        self.key_kinds = [kind for kind, _ in KEY_KINDS]  # Kinds every key seen so far matches
+
+    def add(self, batch):
+        """Hashes a batch and keeps its hashes and keys. Returns (key_hashes, row_hashes)."""
+        keys, key_hashes, row_hashes = hash_batch(batch)
+        self.key_hashes.append(key_hashes)
+        self.row_hashes.append(row_hashes)
+
+        blob, offsets = encode_strings(keys.tolist())
+        self.key_blobs.append(blob)
+        self.key_lengths.append(np.diff(offsets))
+
+        present = keys[keys != '']
+        self.key_kinds = [kind for kind, pattern in KEY_KINDS
+                          if kind in self.key_kinds and present.str.fullmatch(pattern).all()]
+        return key_hashes, row_hashes
+
+    def save(self, path):
+        """
+        Writes the index to an .npz file. Without a unique first column,
+        rows are looked up by their full hash instead of the key hash.
+        """
+        key_hashes = np.concatenate(self.key_hashes) if self.key_hashes else np.empty(0, dtype=np.uint64)
+        row_hashes = np.concatenate(self.row_hashes) if self.row_hashes else np.empty(0, dtype=np.uint64)
+        lengths = np.concatenate(self.key_lengths) if self.key_lengths else np.empty(0, dtype=np.int64)
+
+        unique_keys = len(np.unique(key_hashes)) == len(key_hashes)
+        hashes, key_rows = np.unique(key_hashes if unique_keys else row_hashes, return_index=True)
+        key_offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=key_offsets[1:])
+
+        # Write to a temp file first so a failed save never leaves a partial index
+        temp_path = f"{path}.tmp.npz"
+        np.savez(
+            temp_path,
+            key_name=np.array(self.key_name),
+            key_kind=np.array(self.key_kinds[0] if self.key_kinds else 'text'),
+            unique_keys=np.array(unique_keys),
+            hashes=hashes,
+            row_hashes=row_hashes[key_rows],
+            key_rows=key_rows.astype(np.int64),
+            key_blob=np.concatenate(self.key_blobs) if self.key_blobs else np.empty(0, dtype=np.uint8),
+            key_offsets=key_offsets
+        )
+        os.replace(temp_path, path)
+
+
+class RowHashIndex:
+    """A saved row-hash index, loaded into memory for comparison."""
+
+    def __init__(self, path):
+        with np.load(path) as data:
+            self.key_name = str(data['key_name'])
+            self.key_kind = str(data['key_kind'])
+            self.unique_keys = bool(data['unique_keys'])
+            self.hashes = data['hashes']
+            self.row_hashes = data['row_hashes']
+            self.key_rows = data['key_rows']
+            self.key_blob = data['key_blob']
+            self.key_offsets = data['key_offsets']
+        self.matched = np.zeros(len(self.hashes), dtype=bool)
+
+    def classify(self, key_hashes, row_hashes):
+        """
+        Matches a batch against the index and marks the matched entries.
+        Returns boolean (added, changed) masks over the batch rows.
+        """
+        lookup = key_hashes if self.unique_keys else row_hashes
+        if not len(self.hashes):
+            return np.ones(len(lookup), dtype=bool), np.zeros(len(lookup), dtype=bool)
+
+        positions = np.minimum(np.searchsorted(self.hashes, lookup), len(self.hashes) - 1)
+        found = self.hashes[positions] == lookup
+        self.matched[positions[found]] = True
+        return ~found, found & (self.row_hashes[positions] != row_hashes)
+
+    def unmatched_keys(self):
+        """Returns the typed keys of the entries no batch has matched."""
+        keys = []
+        for row in self.key_rows[~self.matched].tolist():
+            text = decode_strings(self.key_blob, self.key_offsets[row:row + 2])[0]
+            keys.append(restore_key(text, self.key_kind))
+        return keys
+
+
+class ChangeReport:
+    """
+    Builds the row-hash index of an export and, when a previous index is
+    given, the Added/Removed/Changed report against it, from batches fed in
+    a single pass. The previous index is read before anything is written,
+    so the new export may reuse the previous file names.
+    """
+
+    def __init__(self, columns, index_path, report_path, previous_path=None):
+        self.columns = list(columns)
+        self.key_name = str(self.columns[0]) if self.columns else ''
+        self.index_path = index_path
+        self.report_path = report_path
+        self.builder = RowHashIndexBuilder(self.key_name)
+        self.added = 0
+        self.changed = 0
+        self.skipped = None  # Why no comparison was made, if it was not
+
+        self.previous = RowHashIndex(previous_path) if previous_path else None
+        if previous_path is None:
+            self.skipped = "no previous export with a hash index"
+        elif self.previous.key_name != self.key_name:
+            self.skipped = "the key column differs from the previous export"
+            self.previous = None
+
+        if self.previous is not None:
+            self.workbook = openpyxl.Workbook(write_only=True)
+            self.added_sheet = self.workbook.create_sheet('Added')
+            self.removed_sheet = self.workbook.create_sheet('Removed')
+            self.changed_sheet = self.workbook.create_sheet('Changed')
+            self.added_sheet.append(self.columns)
+            self.changed_sheet.append(self.columns)
+
+    def add(self, batch):
+        """Hashes a batch and streams its added and changed rows to the report."""
+        key_hashes, row_hashes = self.builder.add(batch)
+        if self.previous is None:
+            return
+
+        added, changed = self.previous.classify(key_hashes, row_hashes)
+        self.added += int(added.sum())
+        self.changed += int(changed.sum())
+        self._append_rows(self.added_sheet, batch[added])
+        self._append_rows(self.changed_sheet, batch[changed])
+
+    def finish(self):
+        """
+        Saves the new index and the report. Returns a summary dict with the
+        'added', 'removed' and 'changed' counts, or 'skipped' with a reason.
+        """
+        self.builder.save(self.index_path)
+        if self.previous is None:
+            return {'skipped': self.skipped}
+
+        removed_keys = self.previous.unmatched_keys()
+        if self.previous.unique_keys:
+            self.removed_sheet.append([self.key_name])
+            for key in removed_keys:
+                self.removed_sheet.append([key])
+        else:
+            # Rows were matched by content, so a first-column value may stand for several rows
+            self.removed_sheet.append([self.key_name, "Removed rows (first column not unique; matched by full row)"])
+            counts = {}
+            for key in removed_keys:
+                counts[key] = counts.get(key, 0) + 1
+            for key, count in counts.items():
+                self.removed_sheet.append([key, count])
+
+        self.workbook.save(self.report_path)
+        return {
+            'skipped': None,
+            'added': self.added,
+            'removed': len(removed_keys),
+            'changed': self.changed,
+            'unique_keys': self.previous.unique_keys
+        }
+
+    def _append_rows(self, sheet, batch):
+        """Appends a batch to a write-only sheet, with nulls as empty cells."""
+        batch = batch.astype(object).where(batch.notna(), None)
+        for row in batch.itertuples(index=False, name=None):
+            sheet.append(row)
@@ -0,0 +1,158 @@
+import numpy as np
+import openpyxl
+import pandas as pd
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+
+from result_buffer import normalize_as_text
+
+FORMAT_SAMPLE_ROWS = 20000  # Rows sampled to pick Excel column widths and number formats
+MAX_COLUMN_WIDTH = 60  # Widest Excel column the auto-width will set
+MAX_DECIMAL_PLACES = 6  # Columns needing more decimal places keep Excel's General format
+
+
+def compute_column_formats(buffer):
+    """
+    Picks a width and number format per column from a sample of the
+    buffered rows, using vectorized string-length and dtype statistics.
+    Returns a list of (width, number_format or None) in column order.
+    """
+    sample_batches, sampled = [], 0
+    for batch in buffer.iter_batches():
+        sample_batches.append(batch)
+        sampled += len(batch)
+        if sampled >= FORMAT_SAMPLE_ROWS:
+            break
+
+    if not sample_batches:
+        return [(min(len(str(name)) + 2, MAX_COLUMN_WIDTH), None) for name in buffer.columns]
+
+    sample = pd.concat(sample_batches, ignore_index=True).iloc[:FORMAT_SAMPLE_ROWS]
+    text = normalize_as_text(sample)
+
+    formats = []
+    for i, name in enumerate(buffer.columns):
+        column = sample.iloc[:, i]
+        number_format = infer_number_format(column, text.iloc[:, i])
+        text_width = int(text.iloc[:, i].str.len().max())
+
+        if number_format in ('yyyy-mm-dd', 'yyyy-mm-dd hh:mm:ss'):
+            text_width = len(number_format)
+        elif number_format is not None and number_format.startswith('#,##0'):
+            text_width += text_width // 3  # Room for thousands separators
+
+        width = min(max(text_width, len(str(name))) + 2, MAX_COLUMN_WIDTH)
+        formats.append((width, number_format))
+
+    return formats
+
+
+def infer_number_format(column, column_text):
+    """Returns an Excel number format for a sampled column, or None to keep General."""
+    values = column.dropna()
+    if values.empty:
+        return None
+
+    if pd.api.types.is_bool_dtype(values) or pd.api.types.is_integer_dtype(values):
+        return None  # Integers are often IDs, so no thousands separators
+    if pd.api.types.is_timedelta64_dtype(values):
+        return '[h]:mm:ss'
+
+    inferred = pd.api.types.infer_dtype(values, skipna=True)
+    if pd.api.types.is_float_dtype(values) or inferred in ('floating', 'mixed-integer-float'):
+        # Nullable int columns arrive as float64, so integral floats stay General too
+        floats = pd.to_numeric(values, errors='coerce').dropna().to_numpy(dtype=np.float64)
+        for places in range(MAX_DECIMAL_PLACES + 1):
+            if np.allclose(np.round(floats, places), floats, rtol=1e-9, atol=0):
+                return decimal_format(places)
+        return None
+    if inferred == 'date':
+        return 'yyyy-mm-dd'
+    if pd.api.types.is_datetime64_any_dtype(values) or inferred == 'datetime':
+        timestamps = pd.to_datetime(values, errors='coerce').dropna()
+        if (timestamps == timestamps.dt.normalize()).all():
+            return 'yyyy-mm-dd'
+        return 'yyyy-mm-dd hh:mm:ss'
+    if inferred == 'decimal':
+        # Use the largest scale seen in the sample, e.g. DECIMAL(12,4) -> 4 places
+        scale = column_text[column.notna()].str.extract(r'\.(\d+)$')[0].str.len().max()
+        scale = 0 if pd.isna(scale) else int(scale)
+        return decimal_format(scale) if scale <= MAX_DECIMAL_PLACES else None
+    if inferred == 'timedelta':
+        return '[h]:mm:ss'
+    return None
+
+
+def decimal_format(places):
+    """Returns a thousands-separated format with the given decimal places, or None for integers."""
+    if places == 0:
+        return None  # Integral values are often IDs, so they keep General
+    return '#,##0.' + '0' * places
+
+
+def bind_to_template(values, template):
+    """
+    Lazily yields the template cell holding each value, or None for nulls.
+    The cell is reused, so each value must be written before the next is drawn.
+    """
+    for value in values:
+        if value is None:
+            yield None
+        else:
+            # A date-like format on the template is kept when a date or time value is assigned
+            template.value = value
+            yield template
+
+
+def write_excel(buffer, filepath, sort_by=None, deduplicate=False, on_batch=None):
+    """
+    Streams the buffered batches into a write-only openpyxl workbook,
+    so only one batch is held in memory while saving. Column widths and
+    number formats are computed once from a sample and applied per column.
+    Rows can be sorted by one column and/or de-duplicated on the way, and
+    on_batch is called with every written batch.
+
+    Excel ignores a column's style for cells that have their own value, so
+    every non-null cell of a formatted column carries its format. Rows are
+    assembled column-wise per batch and formatted columns share one template
+    cell, so there is no per-row Python work beyond openpyxl's own. What is
+    left is openpyxl's handling of styled cells and the extra style
+    attribute it serialises, roughly 6 us per formatted cell: on 100k rows
+    x 6 columns with 4 formatted this measured 9.7-10.3 s against 7.3-7.7 s
+    unformatted with lxml installed.
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('Sheet1')
+
+    # --- Column widths and formats (must be set before any rows) ---
+    column_templates = {}  # Column position -> template cell for formatted columns
+    for i, (width, number_format) in enumerate(compute_column_formats(buffer)):
+        dimension = sheet.column_dimensions[get_column_letter(i + 1)]
+        dimension.width = width
+        if number_format is not None:
+            dimension.number_format = number_format
+            template = WriteOnlyCell(sheet)
+            template.number_format = number_format
+            column_templates[i] = template
+
+    header = []
+    for name in buffer.columns:
+        cell = WriteOnlyCell(sheet, value=str(name))
+        cell.font = Font(bold=True)
+        header.append(cell)
+    sheet.append(header)
+
+    for batch in buffer.iter_batches(sort_by=sort_by, deduplicate=deduplicate):
+        if on_batch is not None:
+            on_batch(batch)
+        # Nulls (None/NaN/NaT) become empty cells
+        batch = batch.astype(object).where(batch.notna(), None)
+        columns = [batch.iloc[:, i].tolist() for i in range(batch.shape[1])]
+        for i, template in column_templates.items():
+            columns[i] = bind_to_template(columns[i], template)
+        # zip draws one row at a time, so each template holds the value of the row being appended
+        for row in zip(*columns):
+            sheet.append(row)
+
+    workbook.save(filepath)
@@ -1,6 +1,9 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import pandas as pd
+from result_buffer import FETCH_BATCH_SIZE, ResultBuffer
+from change_report import ChangeReport
+from excel_writer import write_excel
 import mysql.connector
 from mysql.connector import Error
 import re
@@ -9,13 +12,22 @@ import threading
 import queue
 import os
 import json
+import time
+import cProfile
+import pstats
+import tracemalloc
 from datetime import datetime
 import webbrowser  # <-- IMPORT ADDED HERE
 
 # --- Configuration and History File constants ---
 CONFIG_FILE = 'config.ini'
 HISTORY_FILE = 'export_history.json'
-ALLOWED_QUERY = "SELECT * FROM consolidated_summary;"  # The only query allowed to run
+ALLOWED_TABLE = 'consolidated_summary'  # The only table the allowed query reads from
+ALLOWED_QUERY = f"SELECT * FROM {ALLOWED_TABLE};"  # The only query allowed to run
+PREVIEW_ROW_LIMIT = 50  # Number of rows fetched for the export preview
+OPTIONS_SECTION = 'options'  # Config section for app-wide options (not a connection)
+PROFILE_TOP_ALLOCATIONS = 25  # Number of allocation sites listed in the profiling summary
+DEFAULT_MEMORY_BUDGET_MB = 256  # Result buffer size before spilling to disk
 
 
 class DbExporterApp:
@@ -26,8 +38,8 @@ class DbExporterApp:
     def __init__(self, root):
         self.root = root
         self.root.title("1.0 Database Exporter | Certainti.Ai")
-        self.root.geometry("600x480")  # Increased height for new settings
-        self.root.minsize(500, 450)
+        self.root.geometry("700x640")  # Increased height for the preview pane
+        self.root.minsize(600, 560)
 
         # --- App state variables ---
         self.config = configparser.ConfigParser()
@@ -36,6 +48,7 @@ class DbExporterApp:
         self.current_settings_section = None  # Tracks which section is being edited
         self.history_data = []  # Stores history records
         self.export_queue = queue.Queue()  # Queue for thread communication
+        self.profile_session = None  # Profiler state for the current export when profiling is enabled
 
         # --- Styling ---
         self.style = ttk.Style()
@@ -93,13 +106,43 @@ class DbExporterApp:
         self.platform_combo = ttk.Combobox(platform_frame, state='readonly', width=30)
         self.platform_combo.pack(side=tk.LEFT, fill='x', expand=True)
 
-        # --- Export Button ---
+        # --- Preview & Export Buttons ---
+        action_frame = ttk.Frame(self.export_frame)
+        action_frame.pack(pady=(0, 10), fill='x')
+
+        self.preview_button = ttk.Button(
+            action_frame,
+            text="Preview",
+            command=self.start_preview_thread
+        )
+        self.preview_button.pack(side=tk.LEFT, fill='x', expand=True, padx=(0, 5))
+
         self.export_button = ttk.Button(
-            self.export_frame,
+            action_frame,
             text="Start Export...",
             command=self.start_export_thread
         )
-        self.export_button.pack(pady=20, fill='x')
+        self.export_button.pack(side=tk.LEFT, fill='x', expand=True, padx=(5, 0))
+
+        # --- Preview Area ---
+        preview_group = ttk.LabelFrame(self.export_frame, text="Preview", padding=10)
+        preview_group.pack(fill='both', expand=True, pady=(0, 10))
+
+        self.preview_summary_var = tk.StringVar(value="Click 'Preview' to see the schema, size estimate and first rows.")
+        preview_summary = ttk.Label(preview_group, textvariable=self.preview_summary_var, wraplength=600, justify=tk.LEFT)
+        preview_summary.pack(fill='x', pady=(0, 5))
+
+        preview_tree_frame = ttk.Frame(preview_group)
+        preview_tree_frame.pack(fill='both', expand=True)
+
+        self.preview_tree = ttk.Treeview(preview_tree_frame, show='headings', height=5)
+        preview_v_scroll = ttk.Scrollbar(preview_tree_frame, orient="vertical", command=self.preview_tree.yview)
+        preview_h_scroll = ttk.Scrollbar(preview_tree_frame, orient="horizontal", command=self.preview_tree.xview)
+        self.preview_tree.configure(yscrollcommand=preview_v_scroll.set, xscrollcommand=preview_h_scroll.set)
+
+        preview_h_scroll.pack(side=tk.BOTTOM, fill='x')
+        preview_v_scroll.pack(side=tk.RIGHT, fill='y')
+        self.preview_tree.pack(fill='both', expand=True)
 
         # --- Status & Feedback Area ---
         status_group = ttk.LabelFrame(self.export_frame, text="Progress", padding=10)
@@ -114,7 +157,7 @@ class DbExporterApp:
         # Use a Text widget for scrolling status messages
         self.status_text = tk.Text(
             status_group,
-            height=10,
+            height=6,
             wrap=tk.WORD,
             font=('Courier New', 9),
             bg="#f0f0f0",
@@ -209,6 +252,59 @@ class DbExporterApp:
         query_entry = ttk.Entry(form_frame, textvariable=self.settings_query_var, state='disabled')
         query_entry.grid(row=5, column=1, sticky=tk.EW, pady=5)
 
+        # --- App-wide options (saved to the [options] section) ---
+        options_frame = ttk.LabelFrame(self.settings_frame, text="Application Options", padding=10)
+        options_frame.pack(side=tk.BOTTOM, fill='x', pady=(10, 0))
+
+        self.profiling_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            options_frame,
+            text="Profile export runs (writes .prof and allocation summary next to the file)",
+            variable=self.profiling_var,
+            command=self.save_app_options
+        ).pack(anchor=tk.W)
+
+        self.change_report_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            options_frame,
+            text="Write change report against the previous export of the platform",
+            variable=self.change_report_var,
+            command=self.save_app_options
+        ).pack(anchor=tk.W)
+
+        self.sort_rows_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            options_frame,
+            text="Sort exported rows by the first column",
+            variable=self.sort_rows_var,
+            command=self.save_app_options
+        ).pack(anchor=tk.W)
+
+        self.drop_duplicates_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            options_frame,
+            text="Drop duplicate rows",
+            variable=self.drop_duplicates_var,
+            command=self.save_app_options
+        ).pack(anchor=tk.W)
+
+        budget_frame = ttk.Frame(options_frame)
+        budget_frame.pack(anchor=tk.W, pady=(5, 0))
+        ttk.Label(budget_frame, text="Memory budget (MB) before spilling to disk:").pack(side=tk.LEFT, padx=(0, 10))
+        self.memory_budget_var = tk.StringVar(value=str(DEFAULT_MEMORY_BUDGET_MB))
+        budget_spinbox = ttk.Spinbox(
+            budget_frame,
+            from_=32,
+            to=65536,
+            increment=32,
+            width=8,
+            textvariable=self.memory_budget_var,
+            command=self.save_app_options
+        )
+        budget_spinbox.pack(side=tk.LEFT)
+        budget_spinbox.bind("<FocusOut>", lambda e: self.save_app_options())
+        budget_spinbox.bind("<Return>", lambda e: self.save_app_options())
+
         # --- Button Frame ---
         button_frame = ttk.Frame(self.settings_frame)
         button_frame.pack(side=tk.BOTTOM, fill='x', pady=(10, 0))
@@ -338,6 +434,9 @@ class DbExporterApp:
                 self.connections[platform_name] = conn_details
                 self.platform_to_section[platform_name] = section
 
+            # Load app-wide options
+            self.load_app_options()
+
             # Update both comboboxes
             self.platform_combo['values'] = platform_names
             self.settings_conn_combo['values'] = platform_names
@@ -353,6 +452,42 @@ class DbExporterApp:
             self.update_status(f"Error reading config file: {e}", "error")
             messagebox.showerror("Config Error", f"Could not parse '{CONFIG_FILE}'.\nError: {e}")
 
+    def load_app_options(self):
+        """Loads the app-wide options from the [options] config section."""
+        if not self.config.has_section(OPTIONS_SECTION):
+            return
+        self.profiling_var.set(self.config.getboolean(OPTIONS_SECTION, 'profiling', fallback=False))
+        self.change_report_var.set(self.config.getboolean(OPTIONS_SECTION, 'change_report', fallback=False))
+        self.sort_rows_var.set(self.config.getboolean(OPTIONS_SECTION, 'sort_rows', fallback=False))
+        self.drop_duplicates_var.set(self.config.getboolean(OPTIONS_SECTION, 'drop_duplicates', fallback=False))
+        self.memory_budget_var.set(str(self.config.getint(OPTIONS_SECTION, 'memory_budget_mb',
+                                                          fallback=DEFAULT_MEMORY_BUDGET_MB)))
+
+    def save_app_options(self):
+        """Writes the app-wide options to the [options] config section."""
+        try:
+            memory_budget = self.memory_budget_var.get().strip()
+            if not memory_budget.isdigit() or int(memory_budget) <= 0:
+                messagebox.showerror("Validation Error", "Memory budget must be a positive whole number of MB.")
+                self.memory_budget_var.set(str(self.config.getint(OPTIONS_SECTION, 'memory_budget_mb',
+                                                                  fallback=DEFAULT_MEMORY_BUDGET_MB)))
+                return
+
+            if not self.config.has_section(OPTIONS_SECTION):
+                self.config.add_section(OPTIONS_SECTION)
+            self.config.set(OPTIONS_SECTION, 'profiling', str(self.profiling_var.get()))
+            self.config.set(OPTIONS_SECTION, 'memory_budget_mb', memory_budget)
+            self.config.set(OPTIONS_SECTION, 'change_report', str(self.change_report_var.get()))
+            self.config.set(OPTIONS_SECTION, 'sort_rows', str(self.sort_rows_var.get()))
+            self.config.set(OPTIONS_SECTION, 'drop_duplicates', str(self.drop_duplicates_var.get()))
+
+            # Options do not affect connections, so no platform reload is needed
+            with open(CONFIG_FILE, 'w') as configfile:
+                self.config.write(configfile)
+        except Exception as e:
+            self.update_status(f"Failed to save options: {e}", "error")
+            messagebox.showerror("Save Error", f"Could not save options.\nError: {e}")
+
     def create_default_config(self):
         """Creates a default config.ini file."""
         default_config = configparser.ConfigParser()
@@ -408,7 +543,7 @@ class DbExporterApp:
         except Exception as e:
             self.update_status(f"Error loading history: {e}", "error")
 
-    def add_to_history(self, platform_name, filepath):
+    def add_to_history(self, platform_name, filepath, hash_index=None):
         """Adds a new record to the history and saves it."""
         try:
             new_record = {
@@ -417,6 +552,8 @@ class DbExporterApp:
                 'filename': os.path.basename(filepath),
                 'filepath': os.path.abspath(filepath)
             }
+            if hash_index:
+                new_record['hash_index'] = os.path.abspath(hash_index)
             self.history_data.append(new_record)
 
             # Save to file
@@ -437,6 +574,47 @@ class DbExporterApp:
         except Exception as e:
             self.update_status(f"Failed to save history: {e}", "error")
 
+    # --- Change Report Methods ---
+
+    def find_previous_hash_index(self, platform_name):
+        """Returns the hash index path of the latest export of the platform, if any."""
+        for record in reversed(self.history_data):
+            path = record.get('hash_index')
+            if record.get('platform') == platform_name and path and os.path.exists(path):
+                return path
+        return None
+
+    def start_change_report(self, buffer, filepath, previous_index):
+        """
+        Returns a ChangeReport for the export, fed by the workbook writer's
+        pass, or None if it could not be set up. Runs in the save thread.
+        """
+        base_path = os.path.splitext(filepath)[0]
+        try:
+            return ChangeReport(buffer.columns, f"{base_path}.rowhash.npz", f"{base_path}_changes.xlsx", previous_index)
+        except Exception as e:
+            self.export_queue.put(("status_error", f"Failed to read the previous hash index: {e}"))
+            return None
+
+    def finish_change_report(self, report):
+        """Saves the index and report, posts a summary and returns the index path (or None)."""
+        try:
+            summary = report.finish()
+        except Exception as e:
+            self.export_queue.put(("status_error", f"Failed to write change report: {e}"))
+            return report.index_path if os.path.exists(report.index_path) else None
+
+        if summary['skipped']:
+            self.export_queue.put(("status", f"Change report skipped: {summary['skipped']}. Hash index saved."))
+        else:
+            note = "" if summary['unique_keys'] else " Rows were matched by full content (first column not unique)."
+            self.export_queue.put(("status", f"Change report saved to {report.report_path} "
+                                             f"({summary['added']} added, {summary['removed']} removed, "
+                                             f"{summary['changed']} changed).{note}"))
+        return report.index_path
+
+    # --- End Change Report Methods ---
+
     # --- New Settings Tab Methods ---
 
     def load_selected_conn_to_form(self, event=None):
@@ -591,47 +769,214 @@ class DbExporterApp:
 
         # --- Start UI feedback ---
         self.export_button.config(state=tk.DISABLED, text="Exporting...")
+        self.preview_button.config(state=tk.DISABLED)
         self.progress_bar.start()
         self.status_text.config(state=tk.NORMAL)  # Clear previous log
         self.status_text.delete('1.0', tk.END)
         self.status_text.config(state=tk.DISABLED)
         self.update_status(f"Starting export for '{selected_platform}'...")
 
+        # --- Start profiling if enabled ---
+        export_target = self.run_export_logic
+        if self.profiling_var.get():
+            self.start_profiling()
+            export_target = self.run_profiled_export_logic
+            self.update_status("Profiling is enabled for this export.")
+
         # --- Start worker thread ---
         # Pass the queue, connection details, and platform name
         threading.Thread(
-            target=self.run_export_logic,
+            target=export_target,
             args=(conn_details, selected_platform),
             daemon=True
         ).start()
 
+    def start_preview_thread(self):
+        """
+        Starts a quick preview of the selected platform in a separate
+        thread: column schema, size estimate and the first rows.
+        """
+        selected_platform = self.platform_combo.get()
+        if not selected_platform:
+            messagebox.showwarning("No Platform", "Please select a platform first.")
+            return
+
+        if selected_platform not in self.connections:
+            messagebox.showerror("Error", f"Could not find connection details for '{selected_platform}'.")
+            return
+
+        conn_details = self.connections[selected_platform]
+
+        # --- Start UI feedback ---
+        self.preview_button.config(state=tk.DISABLED, text="Loading Preview...")
+        self.export_button.config(state=tk.DISABLED)
+        self.progress_bar.start()
+        self.update_status(f"Loading preview for '{selected_platform}'...")
+
+        threading.Thread(
+            target=self.run_preview_logic,
+            args=(conn_details, selected_platform),
+            daemon=True
+        ).start()
+
+    def run_preview_logic(self, conn_details, platform_name):
+        """
+        This function runs in a separate thread.
+        It reads the column schema and size estimate from information_schema
+        and fetches the first PREVIEW_ROW_LIMIT rows of the allowed query,
+        then puts the result (preview dict or Error) into the queue.
+        """
+        try:
+            host, database, user, password, sql_query = self.validate_conn_details(conn_details)
+
+            connection = mysql.connector.connect(
+                host=host,
+                database=database,
+                user=user,
+                password=password
+            )
+
+            if connection.is_connected():
+                cursor = connection.cursor()
+
+                # --- 1. Column schema ---
+                cursor.execute(
+                    "SELECT COLUMN_NAME, COLUMN_TYPE FROM information_schema.COLUMNS "
+                    "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s ORDER BY ORDINAL_POSITION",
+                    (database, ALLOWED_TABLE)
+                )
+                schema = cursor.fetchall()
+
+                # --- 2. Row count and size estimate (NULL for views) ---
+                cursor.execute(
+                    "SELECT TABLE_ROWS, DATA_LENGTH FROM information_schema.TABLES "
+                    "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s",
+                    (database, ALLOWED_TABLE)
+                )
+                estimate = cursor.fetchone() or (None, None)
+
+                # --- 3. Baseline: round trip and query setup, timed with LIMIT 0 ---
+                started = time.perf_counter()
+                cursor.execute(f"{ALLOWED_QUERY.strip().rstrip(';')} LIMIT 0")
+                cursor.fetchall()
+                baseline = time.perf_counter() - started
+
+                # --- 4. Bounded read: the allowed query, stopped after N rows ---
+                preview_query = f"{ALLOWED_QUERY.strip().rstrip(';')} LIMIT {PREVIEW_ROW_LIMIT}"
+                started = time.perf_counter()
+                cursor.execute(preview_query)
+                rows = cursor.fetchall()
+                elapsed = time.perf_counter() - started
+                columns = list(cursor.column_names)
+                cursor.close()
+
+                self.export_queue.put(("preview", {
+                    'platform': platform_name,
+                    'schema': schema,
+                    'columns': columns,
+                    'rows': rows,
+                    'est_rows': estimate[0],
+                    'est_bytes': estimate[1],
+                    'elapsed': elapsed,
+                    'baseline': baseline
+                }))
+
+        except Error as e:
+            self.export_queue.put(("preview_error", f"Database Error: {e}"))
+        except Exception as e:
+            self.export_queue.put(("preview_error", f"An Error Occurred: {e}"))
+
+        finally:
+            if 'connection' in locals() and connection.is_connected():
+                connection.close()
+
+    def show_preview(self, preview):
+        """Fills the preview pane with the schema, estimates and first rows."""
+        columns = preview['columns']
+        column_types = {name: col_type for name, col_type in preview['schema']}
+
+        # Rebuild the preview tree for the new columns
+        for item in self.preview_tree.get_children():
+            self.preview_tree.delete(item)
+        self.preview_tree['columns'] = columns
+        for col in columns:
+            heading = f"{col} ({column_types[col]})" if col in column_types else col
+            self.preview_tree.heading(col, text=heading)
+            self.preview_tree.column(col, width=120, anchor=tk.W, stretch=False)
+
+        for row in preview['rows']:
+            self.preview_tree.insert('', tk.END, values=['' if v is None else str(v) for v in row])
+
+        # Build the summary line
+        est_rows = preview['est_rows']
+        est_bytes = preview['est_bytes']
+        rows_fetched = len(preview['rows'])
+        rows_text = f"~{int(est_rows):,}" if est_rows is not None else "unknown"
+        size_text = self.format_size(est_bytes) if est_bytes is not None else "unknown"
+
+        # Rough ETA from the per-row time of the bounded read, with the
+        # round trip and query setup (the LIMIT 0 baseline) taken out
+        row_seconds = max(preview['elapsed'] - preview['baseline'], 0) / rows_fetched if rows_fetched else 0
+        if est_rows and row_seconds:
+            eta_seconds = row_seconds * int(est_rows) + preview['baseline']
+            eta_text = f"~{eta_seconds:.0f}s" if eta_seconds < 120 else f"~{eta_seconds / 60:.1f} min"
+        elif est_rows and rows_fetched:
+            eta_text = "too fast to measure from the preview"
+        else:
+            eta_text = "unknown"
+
+        self.preview_summary_var.set(
+            f"{preview['platform']}: {len(columns)} columns | Est. rows: {rows_text} | "
+            f"Est. size: {size_text} | Est. fetch time: {eta_text} | Showing first {rows_fetched} rows"
+        )
+        self.update_status(f"Preview loaded ({rows_fetched} rows in {preview['elapsed']:.2f}s).", "success")
+
+    def format_size(self, num_bytes):
+        """Formats a byte count as a human readable string."""
+        size = float(num_bytes)
+        for unit in ('B', 'KB', 'MB', 'GB'):
+            if size < 1024:
+                return f"{size:.1f} {unit}"
+            size /= 1024
+        return f"{size:.1f} TB"
+
+    def validate_conn_details(self, conn_details):
+        """
+        Extracts the connection details from the dict and checks the
+        query against the allowed query policy. Raises ValueError on failure.
+        """
+        host = conn_details.get('host')
+        database = conn_details.get('database')
+        user = conn_details.get('user')
+        password = conn_details.get('password')
+        sql_query = conn_details.get('query')
+
+        if not all([host, database, user, password, sql_query]):
+            raise ValueError("Missing connection details in config file (host, database, user, password, query).")
+
+        # --- REQUIREMENT 3: Check if query is allowed ---
+        # Normalize both queries for a robust comparison
+        # 1. Strip whitespace, 2. Replace multiple spaces with one, 3. Remove trailing semicolon, 4. To lowercase
+        normalized_query = ' '.join(sql_query.strip().split()).rstrip(';').lower()
+        normalized_allowed = ' '.join(ALLOWED_QUERY.strip().split()).rstrip(';').lower()
+
+        if normalized_query != normalized_allowed:
+            # Raise an error that will be caught and sent to the queue
+            raise ValueError(f"Query Not Allowed: Only '{ALLOWED_QUERY}' is permitted by policy.")
+        # --- End Query Check ---
+
+        return host, database, user, password, sql_query
+
     def run_export_logic(self, conn_details, platform_name):
         """
         This function runs in a separate thread.
-        It connects to the DB, fetches data, and puts the
-        result (DataFrame or Error) into the queue.
+        It connects to the DB, fetches data in batches into a
+        ResultBuffer, and puts the result (buffer or Error) into the queue.
         """
+        buffer = None
         try:
-            # --- 1. Get connection details from dict ---
-            host = conn_details.get('host')
-            database = conn_details.get('database')
-            user = conn_details.get('user')
-            password = conn_details.get('password')
-            sql_query = conn_details.get('query')
-
-            if not all([host, database, user, password, sql_query]):
-                raise ValueError("Missing connection details in config file (host, database, user, password, query).")
-
-            # --- REQUIREMENT 3: Check if query is allowed ---
-            # Normalize both queries for a robust comparison
-            # 1. Strip whitespace, 2. Replace multiple spaces with one, 3. Remove trailing semicolon, 4. To lowercase
-            normalized_query = ' '.join(sql_query.strip().split()).rstrip(';').lower()
-            normalized_allowed = ' '.join(ALLOWED_QUERY.strip().split()).rstrip(';').lower()
-
-            if normalized_query != normalized_allowed:
-                # Raise an error that will be caught and sent to the queue
-                raise ValueError(f"Query Not Allowed: Only '{ALLOWED_QUERY}' is permitted by policy.")
-            # --- End Query Check ---
+            # --- 1. Get and validate connection details ---
+            host, database, user, password, sql_query = self.validate_conn_details(conn_details)
 
             self.export_queue.put(("status", "Connecting to database..."))
 
@@ -646,12 +991,16 @@ class DbExporterApp:
             if connection.is_connected():
                 self.export_queue.put(("status", "Successfully connected. Executing query..."))
 
-                # --- 3. Read data into DataFrame ---
-                df = pd.read_sql(sql_query, connection)
-                self.export_queue.put(("status", f"Successfully fetched {len(df)} rows."))
+                # --- 3. Read data in batches into the result buffer ---
+                cursor = connection.cursor()
+                cursor.execute(sql_query)
+                columns = list(cursor.column_names)
+
+                memory_budget_mb = self.config.getint(OPTIONS_SECTION, 'memory_budget_mb',
+                                                      fallback=DEFAULT_MEMORY_BUDGET_MB)
+                buffer = ResultBuffer(columns, memory_budget_mb * 1024 * 1024)
 
                 # --- 4. Clean data (from original script) ---
-                self.export_queue.put(("status", "Cleaning data for Excel compatibility..."))
                 illegal_xml_chars_re = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
 
                 def clean_string(value):
@@ -659,20 +1008,38 @@ class DbExporterApp:
                         return illegal_xml_chars_re.sub('', value)
                     return value
 
-                for col in df.select_dtypes(include=['object']).columns:
-                    df[col] = df[col].apply(clean_string)
+                while True:
+                    rows = cursor.fetchmany(FETCH_BATCH_SIZE)
+                    if not rows:
+                        break
+
+                    batch = pd.DataFrame(rows, columns=columns)
+                    for col in batch.select_dtypes(include=['object']).columns:
+                        batch[col] = batch[col].apply(clean_string)
 
-                self.export_queue.put(("status", "Cleaning complete. Data is ready."))
+                    was_spilled = buffer.spilled
+                    buffer.append(batch)
+                    if buffer.spilled and not was_spilled:
+                        self.export_queue.put(("status", f"Memory budget of {memory_budget_mb} MB reached. "
+                                                         "Spilling fetched rows to disk..."))
+                    self.export_queue.put(("status", f"Fetched {len(buffer)} rows..."))
+
+                cursor.close()
+                self.export_queue.put(("status", f"Successfully fetched and cleaned {len(buffer)} rows."))
 
                 # --- 5. Put successful result in queue ---
-                # We send the dataframe and platform name for the save dialog
-                self.export_queue.put(("success", (df, platform_name)))
+                # We send the buffer and platform name for the save dialog
+                self.export_queue.put(("success", (buffer, platform_name)))
 
         except Error as e:
             # Handle DB errors
+            if buffer is not None:
+                buffer.close()
             self.export_queue.put(("error", f"Database Error: {e}"))
         except Exception as e:
             # Handle other errors (config, pandas, value errors)
+            if buffer is not None:
+                buffer.close()
             self.export_queue.put(("error", f"An Error Occurred: {e}"))
 
         finally:
@@ -681,6 +1048,101 @@ class DbExporterApp:
                 connection.close()
                 self.export_queue.put(("status", "Database connection closed."))
 
+    # --- Profiling Methods ---
+
+    def start_profiling(self):
+        """Starts memory tracing and sets up a new profiling session."""
+        tracemalloc.start()
+        self.profile_session = {
+            'fetch_profiler': None,
+            'fetch_snapshot': None,
+            'fetch_done': threading.Event()  # Set by the worker once its profile is stored
+        }
+
+    def run_profiled_export_logic(self, conn_details, platform_name):
+        """
+        Runs run_export_logic under cProfile in the worker thread and
+        takes a tracemalloc snapshot once the fetch has finished.
+        """
+        session = self.profile_session
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            self.run_export_logic(conn_details, platform_name)
+        finally:
+            profiler.disable()
+            session['fetch_profiler'] = profiler
+            if tracemalloc.is_tracing():
+                session['fetch_snapshot'] = tracemalloc.take_snapshot()
+            session['fetch_done'].set()
+
+    def start_save_profiler(self):
+        """Returns an enabled profiler for the save step, or None when not profiling."""
+        if self.profile_session is None:
+            return None
+        # Only one profiler may be active at a time, so wait for the worker's to finish
+        self.profile_session['fetch_done'].wait(timeout=5)
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def write_profile_report(self, save_profiler, filepath):
+        """
+        Writes the combined fetch + save profile to '<file>.prof' and a
+        top-allocations summary to '<file>_allocations.txt'.
+        """
+        session = self.profile_session
+        base_path = os.path.splitext(filepath)[0]
+        prof_path = f"{base_path}.prof"
+        alloc_path = f"{base_path}_allocations.txt"
+
+        try:
+            # --- 1. cProfile stats (fetch thread + save step) ---
+            stats = pstats.Stats(save_profiler)
+            if session['fetch_profiler'] is not None:
+                stats.add(session['fetch_profiler'])
+            stats.dump_stats(prof_path)
+
+            # --- 2. tracemalloc summary ---
+            trace_filters = (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<unknown>"),
+            )
+            current, peak = tracemalloc.get_traced_memory()
+            snapshots = [("after fetch", session['fetch_snapshot']),
+                         ("after save", tracemalloc.take_snapshot())]
+
+            with open(alloc_path, 'w') as f:
+                f.write(f"Export profile for {os.path.basename(filepath)}\n")
+                f.write(f"Generated: {datetime.now().isoformat(sep=' ', timespec='seconds')}\n")
+                f.write(f"Traced memory: current {self.format_size(current)}, peak {self.format_size(peak)}\n")
+
+                for label, snapshot in snapshots:
+                    if snapshot is None:
+                        continue
+                    f.write(f"\nTop {PROFILE_TOP_ALLOCATIONS} allocations {label}:\n")
+                    top_stats = snapshot.filter_traces(trace_filters).statistics('lineno')
+                    for stat in top_stats[:PROFILE_TOP_ALLOCATIONS]:
+                        f.write(f"  {stat}\n")
+
+            self.update_status(f"Profile written to {prof_path} and {alloc_path}.", "info")
+
+        except Exception as e:
+            self.update_status(f"Failed to write profile report: {e}", "error")
+
+    def stop_profiling(self):
+        """Stops memory tracing and discards the profiling session."""
+        if self.profile_session is None:
+            return
+        # Let the worker store its profile before tracing is stopped
+        self.profile_session['fetch_done'].wait(timeout=5)
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.profile_session = None
+
+    # --- End Profiling Methods ---
+
     def check_queue(self):
         """
         Checks the queue for messages from the worker thread
@@ -694,20 +1156,55 @@ class DbExporterApp:
                 if msg_type == "status":
                     self.update_status(data, "info")
 
+                elif msg_type == "status_error":
+                    self.update_status(data, "error")
+
                 elif msg_type == "error":
                     self.update_status(data, "error")
                     self.stop_export_feedback()
+                    self.stop_profiling()
                     messagebox.showerror("Export Failed", data)
 
-                elif msg_type == "success":
-                    self.update_status("Data fetched! Please choose where to save the file.", "success")
+                elif msg_type == "saved":
+                    platform_name, filepath, hash_index, save_profiler = data
+                    self.stop_export_feedback()
+                    self.update_status("Export complete! File saved successfully.", "success")
+
+                    # --- Add to history ---
+                    self.add_to_history(platform_name, filepath, hash_index)
+
+                    # --- Write profiling output next to the file ---
+                    if save_profiler is not None:
+                        self.write_profile_report(save_profiler, filepath)
+                    self.stop_profiling()
+
+                    messagebox.showinfo("Export Complete", f"File saved successfully to:\n{filepath}")
+
+                elif msg_type == "save_error":
+                    self.update_status(data, "error")
                     self.stop_export_feedback()
+                    self.stop_profiling()
+                    messagebox.showerror("Save Error", data)
 
+                elif msg_type == "preview_error":
+                    self.update_status(data, "error")
+                    self.stop_export_feedback()
+                    messagebox.showerror("Preview Failed", data)
+
+                elif msg_type == "preview":
+                    self.stop_export_feedback()
+                    self.show_preview(data)
+
+                elif msg_type == "success":
                     # Unpack data
-                    df, platform_name = data
+                    buffer, platform_name = data
+
+                    self.update_status(f"Data fetched ({len(buffer)} rows)! Please choose where to save the file.",
+                                       "success")
+                    self.stop_export_feedback()
 
                     # --- Ask user for save location ---
-                    self.prompt_save_file(df, platform_name)
+                    self.prompt_save_file(buffer, platform_name)
 
         except queue.Empty:
             # No messages in queue, just check again later
@@ -720,11 +1217,12 @@ class DbExporterApp:
         """Resets the export button and progress bar."""
         self.progress_bar.stop()
         self.export_button.config(state=tk.NORMAL, text="Start Export...")
+        self.preview_button.config(state=tk.NORMAL, text="Preview")
 
-    def prompt_save_file(self, df, platform_name):
+    def prompt_save_file(self, buffer, platform_name):
         """
         Prompts the user to select a save location and
-        saves the DataFrame to an Excel file.
+        saves the buffered result to an Excel file.
         """
         # Suggest a filename
         safe_name = re.sub(r'[^a-z0-9_]', '', platform_name.lower().replace(' ', '_'))
@@ -739,22 +1237,57 @@ class DbExporterApp:
 
         if not filepath:
             self.update_status("Save operation cancelled by user.", "info")
+            buffer.close()
+            self.stop_profiling()
             return
 
-        # --- Save the file (this is fast, so no new thread needed) ---
+        # --- Save on a worker thread so the UI stays responsive ---
+        save_options = {
+            'sort_by': buffer.columns[0] if self.sort_rows_var.get() and buffer.columns else None,
+            'deduplicate': self.drop_duplicates_var.get(),
+            'change_report': self.change_report_var.get(),
+            # Read on the main thread, which owns the history
+            'previous_index': self.find_previous_hash_index(platform_name) if self.change_report_var.get() else None
+        }
+
+        self.export_button.config(state=tk.DISABLED, text="Saving...")
+        self.preview_button.config(state=tk.DISABLED)
+        self.progress_bar.start()
+        self.update_status(f"Saving file to {filepath}...", "info")
+
+        threading.Thread(
+            target=self.run_save_logic,
+            args=(buffer, platform_name, filepath, save_options),
+            daemon=True
+        ).start()
+
+    def run_save_logic(self, buffer, platform_name, filepath, save_options):
+        """
+        This function runs in a separate thread.
+        It writes the workbook and, if enabled, the change report in the
+        same pass over the buffer, then puts the result into the queue.
+        """
+        save_profiler = self.start_save_profiler()
         try:
-            self.update_status(f"Saving file to {filepath}...", "info")
-            df.to_excel(filepath, index=False, engine='openpyxl')
-            self.update_status(f"Export complete! File saved successfully.", "success")
+            report = None
+            if save_options['change_report']:
+                report = self.start_change_report(buffer, filepath, save_options['previous_index'])
 
-            # --- Add to history ---
-            self.add_to_history(platform_name, filepath)
+            try:
+                write_excel(buffer, filepath, save_options['sort_by'], save_options['deduplicate'],
+                            on_batch=report.add if report is not None else None)
+            finally:
+                if save_profiler is not None:
+                    save_profiler.disable()
 
-            messagebox.showinfo("Export Complete", f"File saved successfully to:\n{filepath}")
+            hash_index = self.finish_change_report(report) if report is not None else None
+            self.export_queue.put(("saved", (platform_name, filepath, hash_index, save_profiler)))
 
         except Exception as e:
-            self.update_status(f"Failed to save file: {e}", "error")
-            messagebox.showerror("Save Error", f"Could not save the file.\nError: {e}")
+            self.export_queue.put(("save_error", f"Could not save the file.\nError: {e}"))
+
+        finally:
+            buffer.close()
 
 
 # --- Main entry point ---
@@ -0,0 +1,356 @@
+import heapq
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+FETCH_BATCH_SIZE = 10000  # Rows fetched from the cursor per batch
+MERGE_SLICE_ROWS = 1000  # Most rows read at a time from each sorted run during an external sort
+MIN_MERGE_SLICE_ROWS = 64  # Fewest rows read at a time, so a slice never costs a file open per row
+MAX_MERGE_FAN_IN = 32  # Most runs merged at once; more runs are merged in extra passes
+PYTHON_ROW_OVERHEAD = 4  # Rough size of a row as Python tuple objects vs. its DataFrame size
+
+
+def normalize_as_text(df):
+    """
+    Returns the DataFrame as text with nulls as '', so values hash the same
+    regardless of dtype. Integral floats are written as ints, because an
+    integer column becomes float64 in any batch that contains a NULL.
+    """
+    columns = {}
+    for i in range(df.shape[1]):
+        column = df.iloc[:, i]
+        if column.dtype == object and pd.api.types.infer_dtype(column, skipna=True) in ('floating', 'mixed-integer-float'):
+            column = pd.to_numeric(column, errors='coerce')
+
+        if pd.api.types.is_float_dtype(column):
+            integral = column.notna() & (column % 1 == 0) & (column.abs() < 2 ** 63)
+            text = column.astype(object)
+            text[integral] = column[integral].astype(np.int64).astype(object)
+            column = text
+
+        columns[i] = column.astype(object).where(column.notna(), '').astype(str)
+
+    text = pd.DataFrame(columns, index=df.index)
+    text.columns = df.columns
+    return text
+
+
+def encode_strings(strings):
+    """Encodes strings as one UTF-8 byte blob and an int64 offsets array of length n + 1."""
+    encoded = [value.encode('utf-8', 'surrogatepass') for value in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def decode_strings(blob, offsets):
+    """Decodes the strings between consecutive offsets of a blob (bytes or uint8 array)."""
+    bounds = offsets.tolist()
+    return [bytes(blob[begin:end]).decode('utf-8', 'surrogatepass') for begin, end in zip(bounds[:-1], bounds[1:])]
+
+
+class HashSet:
+    """
+    A set of uint64 row hashes kept as a few sorted numpy runs that are
+    merged when a run reaches the size of the one before it (log-structured).
+    Lookups are a searchsorted per run, so each batch costs O(batch * log^2 n)
+    and the merges O(n log n) in total, with 8 bytes per distinct hash.
+    """
+
+    def __init__(self):
+        self.runs = []  # Sorted uint64 arrays, sizes decreasing
+        self.merged_items = 0  # Hashes copied by merges so far
+
+    def __len__(self):
+        return sum(len(run) for run in self.runs)
+
+    def add_new(self, hashes):
+        """
+        Adds the hashes and returns a mask of the positions whose hash was not
+        in the set before (the first occurrence of repeats within the array).
+        """
+        unique_hashes, first_positions = np.unique(hashes, return_index=True)
+        new = np.ones(len(unique_hashes), dtype=bool)
+        for run in self.runs:
+            positions = np.minimum(np.searchsorted(run, unique_hashes), len(run) - 1)
+            new &= run[positions] != unique_hashes
+
+        mask = np.zeros(len(hashes), dtype=bool)
+        mask[first_positions[new]] = True
+
+        if new.any():
+            self.runs.append(unique_hashes[new])
+            while len(self.runs) > 1 and len(self.runs[-2]) <= len(self.runs[-1]):
+                last = self.runs.pop()
+                merged = np.concatenate((self.runs.pop(), last))
+                merged.sort(kind='mergesort')
+                self.merged_items += len(merged)
+                self.runs.append(merged)
+        return mask
+
+
+class ResultBuffer:
+    """
+    Holds fetched result batches in memory and spills them to a temporary
+    memory-mapped columnar store once the memory budget is exceeded.
+    Each column of a spilled chunk is one .npy file. Text is stored as a
+    UTF-8 byte blob plus offsets, so long values cost only their own bytes.
+    Batches can be re-read in order, sorted (external merge sort) or
+    de-duplicated without loading the whole result.
+    """
+
+    def __init__(self, columns, memory_budget_bytes):
+        self.columns = list(columns)
+        self.memory_budget = memory_budget_bytes
+        self.row_count = 0
+        self.memory_used = 0  # Bytes held by in-memory batches
+        self.chunks = []  # In-memory DataFrames, or (chunk_dir, kinds, length) tuples once spilled
+        self.spill_dir = None
+        self.spill_count = 0
+
+    def __len__(self):
+        return self.row_count
+
+    @property
+    def spilled(self):
+        return self.spill_dir is not None
+
+    def append(self, batch):
+        """Adds a batch, spilling everything to disk once the budget is exceeded."""
+        self.row_count += len(batch)
+        if self.spilled:
+            self.chunks.append(self._spill(batch))
+            return
+
+        self.chunks.append(batch)
+        self.memory_used += int(batch.memory_usage(deep=True).sum())
+        if self.memory_used > self.memory_budget:
+            self.spill_dir = tempfile.mkdtemp(prefix='db_exporter_')
+            self.chunks = [self._spill(chunk) for chunk in self.chunks]
+            self.memory_used = 0
+
+    def iter_batches(self, sort_by=None, ascending=True, deduplicate=False):
+        """
+        Yields the buffered rows as DataFrame batches, optionally sorted by
+        one column (nulls last) and/or with duplicate rows dropped (the
+        first occurrence in output order is kept).
+        """
+        if sort_by is None:
+            batches = (self._load(chunk) if isinstance(chunk, tuple) else chunk for chunk in self.chunks)
+        elif not self.spilled:
+            # Everything fits in the budget, so sort in memory
+            batches = self._sorted_batches(self.chunks, sort_by, ascending)
+        else:
+            batches = self._iter_external_sort(sort_by, ascending)
+
+        if not deduplicate:
+            yield from batches
+            return
+
+        seen = HashSet()
+        for batch in batches:
+            hashes = pd.util.hash_pandas_object(normalize_as_text(batch), index=False).to_numpy(dtype=np.uint64)
+            yield batch[seen.add_new(hashes)]
+
+    def close(self):
+        """Deletes the spill files, if any."""
+        if self.spill_dir is not None:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+            self.spill_dir = None
+        self.chunks = []
+
+    def _sorted_batches(self, frames, sort_by, ascending):
+        """
+        Yields the rows of in-memory frames sorted by one column (nulls last,
+        ties in input order). Only the sort column is concatenated; output
+        batches are gathered from the frames, so no sorted copy is held.
+        """
+        if not frames:
+            return
+        keys = pd.concat([frame[sort_by] for frame in frames], ignore_index=True)
+        order = keys.sort_values(ascending=ascending, na_position='last', kind='stable').index.to_numpy()
+        starts = np.cumsum([0] + [len(frame) for frame in frames])
+
+        for start in range(0, len(order), FETCH_BATCH_SIZE):
+            positions = order[start:start + FETCH_BATCH_SIZE]
+            frame_ids = np.searchsorted(starts, positions, side='right') - 1
+            parts, part_order = [], []
+            for frame_id in np.unique(frame_ids):
+                selected = np.flatnonzero(frame_ids == frame_id)
+                parts.append(frames[frame_id].iloc[positions[selected] - starts[frame_id]])
+                part_order.append(selected)
+            batch = pd.concat(parts, ignore_index=True)
+            yield batch.iloc[np.argsort(np.concatenate(part_order), kind='stable')].reset_index(drop=True)
+
+    def _iter_external_sort(self, sort_by, ascending):
+        """
+        Sorts groups of chunks that fit the memory budget into on-disk runs,
+        then k-way merges the runs, in extra passes if there are more than
+        MAX_MERGE_FAN_IN of them.
+        """
+        sort_pos = self.columns.index(sort_by)
+        runs = []  # Each run is a list of spilled chunks in sorted order
+        try:
+            # --- 1. Runs sized to the memory budget ---
+            group, group_bytes, total_bytes = [], 0, 0
+            for chunk in self.chunks:
+                frame = self._load(chunk)
+                size = int(frame.memory_usage(deep=True).sum())
+                total_bytes += size
+                if group and group_bytes + size > self.memory_budget:
+                    runs.append(self._write_run(self._sorted_batches(group, sort_by, ascending)))
+                    group, group_bytes = [], 0
+                group.append(frame)
+                group_bytes += size
+            if group:
+                runs.append(self._write_run(self._sorted_batches(group, sort_by, ascending)))
+            group = None
+            row_bytes = max(1, total_bytes // max(self.row_count, 1))
+
+            # Nulls sort last in both directions
+            if ascending:
+                def sort_key(row):
+                    value = row[sort_pos]
+                    return (1,) if pd.isna(value) else (0, value)
+            else:
+                def sort_key(row):
+                    value = row[sort_pos]
+                    return (0,) if pd.isna(value) else (1, value)
+
+            # --- 2. Merge passes until the fan-in is small enough ---
+            while len(runs) > MAX_MERGE_FAN_IN:
+                merged_runs = []
+                for start in range(0, len(runs), MAX_MERGE_FAN_IN):
+                    group_runs = runs[start:start + MAX_MERGE_FAN_IN]
+                    merged_runs.append(self._write_run(self._merge_runs(group_runs, sort_key, ascending, row_bytes)))
+                    self._delete_runs(group_runs)
+                runs = merged_runs
+
+            # --- 3. Final merge ---
+            yield from self._merge_runs(runs, sort_key, ascending, row_bytes)
+        finally:
+            self._delete_runs(runs)
+
+    def _merge_runs(self, runs, sort_key, ascending, row_bytes):
+        """
+        Yields the merged rows of sorted runs as DataFrame batches. Each run is
+        read a slice at a time, with the slice size chosen so all open slices
+        together stay within the memory budget.
+        """
+        slice_rows = self.memory_budget // (max(len(runs), 1) * row_bytes * PYTHON_ROW_OVERHEAD)
+        slice_rows = int(min(MERGE_SLICE_ROWS, max(MIN_MERGE_SLICE_ROWS, slice_rows)))
+
+        merged = heapq.merge(*(self._iter_rows(run, slice_rows) for run in runs), key=sort_key, reverse=not ascending)
+        rows = []
+        for row in merged:
+            rows.append(row)
+            if len(rows) == FETCH_BATCH_SIZE:
+                yield pd.DataFrame(rows, columns=self.columns)
+                rows = []
+        if rows:
+            yield pd.DataFrame(rows, columns=self.columns)
+
+    def _write_run(self, batches):
+        """Spills sorted batches as one run (a list of chunks)."""
+        return [self._spill(batch) for batch in batches]
+
+    def _delete_runs(self, runs):
+        for run in runs:
+            for chunk_dir, _, _ in run:
+                shutil.rmtree(chunk_dir, ignore_errors=True)
+
+    def _iter_rows(self, run, slice_rows):
+        """Yields the rows of a run as tuples, a slice at a time."""
+        for chunk in run:
+            for start in range(0, chunk[2], slice_rows):
+                yield from self._load(chunk, start, start + slice_rows).itertuples(index=False, name=None)
+
+    def _spill(self, batch):
+        """Writes a batch to a new chunk directory and returns its (dir, kinds, length)."""
+        chunk_dir = os.path.join(self.spill_dir, f"chunk_{self.spill_count}")
+        self.spill_count += 1
+        os.mkdir(chunk_dir)
+
+        kinds = []
+        for i in range(len(self.columns)):
+            kind, values, mask = self._to_array(batch.iloc[:, i])
+            kinds.append(kind)
+            if kind in ('decimal', 'text'):
+                blob, offsets = values
+                np.save(os.path.join(chunk_dir, f"{i}.npy"), blob)
+                np.save(os.path.join(chunk_dir, f"{i}.offsets.npy"), offsets)
+            else:
+                np.save(os.path.join(chunk_dir, f"{i}.npy"), values)
+            if mask is not None:
+                np.save(os.path.join(chunk_dir, f"{i}.mask.npy"), mask)
+
+        return chunk_dir, kinds, len(batch)
+
+    def _load(self, chunk, start=None, stop=None):
+        """Reads rows [start:stop] of a spilled chunk back into a DataFrame."""
+        chunk_dir, kinds, length = chunk
+        start = 0 if start is None else start
+        stop = length if stop is None else min(stop, length)
+
+        data = {}
+        for i, kind in enumerate(kinds):
+            # Copy slices out of the memory maps so the files are not held open
+            values = np.load(os.path.join(chunk_dir, f"{i}.npy"), mmap_mode='r')
+            mask = None
+            if kind in ('integer', 'decimal', 'text'):
+                mask = np.array(np.load(os.path.join(chunk_dir, f"{i}.mask.npy"), mmap_mode='r')[start:stop])
+
+            if kind in ('decimal', 'text'):
+                offsets = np.array(np.load(os.path.join(chunk_dir, f"{i}.offsets.npy"), mmap_mode='r')[start:stop + 1])
+                blob = bytes(values[offsets[0]:offsets[-1]]) if len(offsets) else b''
+                values = decode_strings(blob, offsets - (offsets[0] if len(offsets) else 0))
+            else:
+                values = np.array(values[start:stop])
+            data[i] = self._from_array(kind, values, mask)
+
+        frame = pd.DataFrame(data)
+        frame.columns = self.columns
+        return frame
+
+    def _to_array(self, series):
+        """
+        Converts a column to memory-mappable data. Returns (kind, values, null mask);
+        for 'decimal' and 'text' the values are a (blob, offsets) pair.
+        """
+        if isinstance(series.dtype, np.dtype) and series.dtype.kind in 'biufmM':
+            return 'native', series.to_numpy(), None
+
+        mask = series.isna().to_numpy()
+        inferred = pd.api.types.infer_dtype(series, skipna=True)
+        if inferred == 'integer':
+            return 'integer', series.where(~mask, 0).to_numpy(dtype=np.int64), mask
+        if inferred in ('floating', 'mixed-integer-float'):
+            return 'native', series.to_numpy(dtype=np.float64, na_value=np.nan), None
+        # numpy's day/microsecond units cover MySQL's full DATE/DATETIME range
+        if inferred == 'date':
+            return 'date', np.array(series.where(~mask, None).tolist(), dtype='datetime64[D]'), None
+        if inferred == 'datetime':
+            return 'datetime', np.array(series.where(~mask, None).tolist(), dtype='datetime64[us]'), None
+        if inferred == 'timedelta':
+            return 'native', pd.to_timedelta(series).to_numpy(), None
+
+        # Decimals are kept as text so they round-trip exactly
+        kind = 'decimal' if inferred == 'decimal' else 'text'
+        return kind, encode_strings(series.where(~mask, '').astype(str).tolist()), mask
+
+    def _from_array(self, kind, values, mask):
+        """Restores a column stored by _to_array."""
+        if kind == 'native':
+            return pd.Series(values)
+        if kind == 'integer':
+            return pd.Series(pd.array(values, dtype='Int64', copy=False)).mask(mask)
+        if kind in ('date', 'datetime'):
+            # NaT converts to None
+            return pd.Series(values.astype(object), dtype=object)
+        if kind == 'decimal':
+            return pd.Series([None if null else Decimal(v) for v, null in zip(values, mask.tolist())], dtype=object)
+        return pd.Series(values, dtype=object).where(~mask, None)
@@ -0,0 +1,113 @@
+import datetime
+import os
+
+import openpyxl
+import pandas as pd
+
+from change_report import ChangeReport, RowHashIndex
+from result_buffer import ResultBuffer
+
+
+def make_buffer(frame, budget=1 << 30, batch_size=1000):
+    buffer = ResultBuffer(frame.columns, budget)
+    for start in range(0, len(frame), batch_size):
+        buffer.append(frame.iloc[start:start + batch_size].reset_index(drop=True))
+    return buffer
+
+
+def run_report(frame, index_path, report_path, previous_path=None, **buffer_options):
+    buffer = make_buffer(frame, **buffer_options)
+    report = ChangeReport(buffer.columns, index_path, report_path, previous_path)
+    for batch in buffer.iter_batches():
+        report.add(batch)
+    summary = report.finish()
+    buffer.close()
+    return summary
+
+
+def read_sheet(path, name):
+    sheet = openpyxl.load_workbook(path)[name]
+    return [list(row) for row in sheet.iter_rows(values_only=True)]
+
+
+def test_classifies_added_removed_and_changed(tmp_path):
+    old = pd.DataFrame({'id': [1, 2, 3, 4], 'value': ['a', 'b', 'c', 'd']})
+    new = pd.DataFrame({'id': [1, 3, 4, 5], 'value': ['a', 'C', 'd', 'e']})
+    index = str(tmp_path / 'old.rowhash.npz')
+
+    assert run_report(old, index, str(tmp_path / 'old_changes.xlsx')) == {'skipped': 'no previous export with a hash index'}
+    summary = run_report(new, str(tmp_path / 'new.rowhash.npz'), str(tmp_path / 'new_changes.xlsx'), index)
+
+    assert (summary['added'], summary['removed'], summary['changed']) == (1, 1, 1)
+    report = str(tmp_path / 'new_changes.xlsx')
+    assert read_sheet(report, 'Added') == [['id', 'value'], [5, 'e']]
+    assert read_sheet(report, 'Changed') == [['id', 'value'], [3, 'C']]
+    # Removed keys keep their numeric type
+    assert read_sheet(report, 'Removed') == [['id'], [2]]
+
+
+def test_reads_previous_index_before_same_path_overwrite(tmp_path):
+    index = str(tmp_path / 'same.rowhash.npz')
+    report = str(tmp_path / 'same_changes.xlsx')
+
+    run_report(pd.DataFrame({'id': [1, 2], 'c': [5, 6]}), index, report)
+    summary = run_report(pd.DataFrame({'id': [1, 3], 'c': [5, 7]}), index, report, index)
+
+    assert (summary['added'], summary['removed'], summary['changed']) == (1, 1, 0)
+    assert RowHashIndex(index).hashes.size == 2
+
+
+def test_null_float_coercion_is_not_a_change(tmp_path):
+    index = str(tmp_path / 'a.rowhash.npz')
+    run_report(pd.DataFrame({'id': [1, 2], 'c': [5, None]}), index, str(tmp_path / 'a.xlsx'))
+    summary = run_report(pd.DataFrame({'id': [1, 2], 'c': [5, 9]}), str(tmp_path / 'b.rowhash.npz'),
+                         str(tmp_path / 'b.xlsx'), index)
+
+    assert (summary['added'], summary['removed'], summary['changed']) == (0, 0, 1)
+    assert read_sheet(str(tmp_path / 'b.xlsx'), 'Changed') == [['id', 'c'], [2, 9]]
+
+
+def test_in_memory_and_spilled_buffers_hash_the_same(tmp_path):
+    rows = 3000
+    frame = pd.DataFrame({
+        'id': range(rows),
+        'parent_id': [None if i % 7 == 0 else i * 3 for i in range(rows)],
+        'day': [datetime.date(2024, 1, 1 + i % 28) for i in range(rows)],
+        'note': [f"n{i}" if i % 5 else None for i in range(rows)],
+    })
+    index = str(tmp_path / 'mem.rowhash.npz')
+    run_report(frame, index, str(tmp_path / 'mem.xlsx'))
+    summary = run_report(frame, str(tmp_path / 'disk.rowhash.npz'), str(tmp_path / 'disk.xlsx'), index,
+                         budget=0, batch_size=700)
+
+    assert (summary['added'], summary['removed'], summary['changed']) == (0, 0, 0)
+
+
+def test_non_unique_keys_match_by_row_and_count_removed(tmp_path):
+    index = str(tmp_path / 'a.rowhash.npz')
+    run_report(pd.DataFrame({'id': [1, 1, 2], 'c': ['x', 'y', 'z']}), index, str(tmp_path / 'a.xlsx'))
+    summary = run_report(pd.DataFrame({'id': [1, 2], 'c': ['x', 'z']}), str(tmp_path / 'b.rowhash.npz'),
+                         str(tmp_path / 'b.xlsx'), index)
+
+    assert not summary['unique_keys']
+    assert (summary['added'], summary['removed'], summary['changed']) == (0, 1, 0)
+    removed = read_sheet(str(tmp_path / 'b.xlsx'), 'Removed')
+    assert removed[1] == [1, 1]
+
+
+def test_long_key_does_not_pad_the_index(tmp_path):
+    keys = ['k' * 2000] + [f"key{i}" for i in range(1, 20000)]
+    index = str(tmp_path / 'long.rowhash.npz')
+    run_report(pd.DataFrame({'key': keys, 'value': range(20000)}), index, str(tmp_path / 'long.xlsx'))
+
+    # Two 8-byte hashes, an 8-byte row and offset per key, plus the key bytes
+    assert os.path.getsize(index) < 20000 * 40 + sum(len(key) for key in keys) + 4096
+
+
+def test_key_column_change_skips_comparison(tmp_path):
+    index = str(tmp_path / 'a.rowhash.npz')
+    run_report(pd.DataFrame({'id': [1]}), index, str(tmp_path / 'a.xlsx'))
+    summary = run_report(pd.DataFrame({'code': [1]}), str(tmp_path / 'b.rowhash.npz'), str(tmp_path / 'b.xlsx'), index)
+
+    assert summary['skipped'] == "the key column differs from the previous export"
+    assert not os.path.exists(str(tmp_path / 'b.xlsx'))
@@ -0,0 +1,107 @@
+import datetime
+from decimal import Decimal
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from excel_writer import MAX_COLUMN_WIDTH, compute_column_formats, infer_number_format, write_excel
+from result_buffer import ResultBuffer, normalize_as_text
+
+
+def make_buffer(frame, budget=1 << 30, batch_size=1000):
+    buffer = ResultBuffer(frame.columns, budget)
+    for start in range(0, len(frame), batch_size):
+        buffer.append(frame.iloc[start:start + batch_size].reset_index(drop=True))
+    return buffer
+
+
+def column_format(values):
+    column = pd.Series(values)
+    return infer_number_format(column, normalize_as_text(column.to_frame()).iloc[:, 0])
+
+
+def test_integers_and_integral_floats_stay_general():
+    assert column_format([1, 2, 3]) is None
+    # A nullable INT column arrives as float64 with NaN
+    assert column_format([10.0, np.nan, 12.0]) is None
+    assert column_format([np.nan, np.nan]) is None
+
+
+def test_float_places_come_from_the_sample():
+    assert column_format([1.5, 2.25, np.nan]) == '#,##0.00'
+    assert column_format([0.00042, 1.0]) == '#,##0.00000'
+    assert column_format([1.0 / 3]) is None  # Needs more than the maximum places
+
+
+def test_decimal_scale_comes_from_the_text():
+    assert column_format([Decimal('12.5000'), Decimal('3.1000'), None]) == '#,##0.0000'
+    assert column_format([Decimal('12'), Decimal('7')]) is None
+    assert column_format([Decimal('1.12345678')]) is None
+
+
+def test_dates_times_and_durations():
+    assert column_format([datetime.date(2024, 1, 2), None]) == 'yyyy-mm-dd'
+    assert column_format(pd.to_datetime(['2024-01-02', '2024-03-04'])) == 'yyyy-mm-dd'
+    assert column_format([pd.Timestamp('2024-01-02'), pd.Timestamp('2024-03-04 05:06:07')]) == 'yyyy-mm-dd hh:mm:ss'
+    assert column_format(pd.to_timedelta(['01:02:03', '30:00:00'])) == '[h]:mm:ss'
+    assert column_format(['abc', 'de']) is None
+
+
+def test_widths_follow_text_length_and_are_capped():
+    frame = pd.DataFrame({
+        'id': [1, 22, 333],
+        'note': ['x' * 200, 'y', None],
+        'amount': [Decimal('1234567.50'), Decimal('1.25'), None],
+        'day': [datetime.date(2024, 1, 2)] * 3,
+    })
+    buffer = make_buffer(frame)
+    try:
+        formats = compute_column_formats(buffer)
+    finally:
+        buffer.close()
+
+    assert formats[0] == (len('id') + 3, None)
+    assert formats[1] == (MAX_COLUMN_WIDTH, None)
+    assert formats[2] == (len('1234567.50') + len('1234567.50') // 3 + 2, '#,##0.00')
+    assert formats[3] == (len('yyyy-mm-dd') + 2, 'yyyy-mm-dd')
+
+
+def test_compute_column_formats_of_an_empty_buffer():
+    buffer = ResultBuffer(['id', 'a_long_column_name'], 1 << 30)
+    try:
+        assert compute_column_formats(buffer) == [(4, None), (20, None)]
+    finally:
+        buffer.close()
+
+
+def test_write_excel_sets_formats_on_every_value_cell(tmp_path):
+    frame = pd.DataFrame({
+        'id': [3, 1, 2, 1],
+        'amount': [Decimal('10.50'), Decimal('2.25'), None, Decimal('2.25')],
+        'day': [datetime.date(2024, 1, 3), datetime.date(2024, 1, 1), None, datetime.date(2024, 1, 1)],
+        'ratio': [0.5, 0.125, np.nan, 0.125],
+    })
+    buffer = make_buffer(frame, batch_size=2)
+    path = str(tmp_path / 'out.xlsx')
+    written = []
+    try:
+        write_excel(buffer, path, sort_by='id', deduplicate=True, on_batch=written.append)
+    finally:
+        buffer.close()
+
+    assert sum(len(batch) for batch in written) == 3
+    sheet = openpyxl.load_workbook(path)['Sheet1']
+    rows = list(sheet.iter_rows())
+    assert [cell.value for cell in rows[0]] == ['id', 'amount', 'day', 'ratio']
+    assert rows[0][0].font.bold
+    assert [row[0].value for row in rows[1:]] == [1, 2, 3]
+
+    one, two, three = rows[1:]
+    assert one[1].value == 2.25 and one[1].number_format == '#,##0.00'
+    assert one[2].value.date() == datetime.date(2024, 1, 1) and one[2].number_format == 'yyyy-mm-dd'
+    assert one[3].value == 0.125 and one[3].number_format == '#,##0.000'
+    assert three[1].value == 10.5 and three[1].number_format == '#,##0.00'
+    assert one[0].number_format == 'General'
+    assert [cell.value for cell in two[1:]] == [None, None, None]
+    assert sheet.column_dimensions['B'].width == len('amount') + 2
@@ -0,0 +1,191 @@
+import datetime
+import math
+import os
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import result_buffer
+from result_buffer import HashSet, ResultBuffer, normalize_as_text
+
+COLUMNS = ['id', 'amount', 'day', 'stamp', 'duration', 'parent_id', 'note']
+
+
+def make_rows(count):
+    rows = []
+    for i in range(count):
+        rows.append((
+            i,
+            Decimal(f"{i}.1250") if i % 7 else None,
+            datetime.date(9999, 12, 31) if i % 5 == 0 else (None if i % 13 == 0 else datetime.date(2024, 1, 1 + i % 28)),
+            datetime.datetime(2024, 3, 1, 12, i % 60, 0, 123456) if i % 17 else None,
+            datetime.timedelta(hours=i % 24, minutes=i % 60) if i % 11 else None,
+            (i * 3) % 101 if i % 9 else None,
+            None if i % 4 == 0 else f"note {i} é中"
+        ))
+    return rows
+
+
+def make_buffer(rows, budget, batch_size=300, columns=COLUMNS):
+    buffer = ResultBuffer(columns, budget)
+    for start in range(0, len(rows), batch_size):
+        batch = pd.DataFrame(rows[start:start + batch_size], columns=columns)
+        # Nullable ints arrive from the cursor as Python ints with None
+        if 'parent_id' in columns:
+            batch['parent_id'] = pd.Series([row[5] for row in rows[start:start + batch_size]], dtype=object)
+        buffer.append(batch)
+    return buffer
+
+
+def as_values(frame, column):
+    series = frame[column]
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+@pytest.fixture
+def rows():
+    return make_rows(2500)
+
+
+def test_stays_in_memory_within_budget(rows):
+    buffer = make_buffer(rows, 1 << 30)
+    assert not buffer.spilled
+    assert len(buffer) == len(rows)
+    buffer.close()
+
+
+def test_spill_round_trips_types(rows):
+    buffer = make_buffer(rows, 20000)
+    spill_dir = buffer.spill_dir
+    assert buffer.spilled
+    assert len(buffer) == len(rows)
+
+    result = pd.concat(list(buffer.iter_batches()), ignore_index=True)
+    expected = pd.DataFrame(rows, columns=COLUMNS)
+    for i, column in enumerate(COLUMNS):
+        assert as_values(result, column) == [row[i] for row in rows], column
+
+    assert isinstance(as_values(result, 'amount')[1], Decimal)
+    assert as_values(result, 'amount')[1] == Decimal('1.1250')
+    assert isinstance(as_values(result, 'day')[1], datetime.date)
+    assert as_values(result, 'day')[0] == datetime.date(9999, 12, 31)
+    assert as_values(result, 'parent_id')[1] == 3
+    assert as_values(result, 'duration')[1] == datetime.timedelta(hours=1, minutes=1)
+    assert len(result) == len(expected)
+
+    buffer.close()
+    assert not os.path.exists(spill_dir)
+
+
+def test_long_text_costs_only_its_bytes():
+    rows = [(i, 'x' * 5000 if i == 0 else 'y') for i in range(1000)]
+    buffer = make_buffer(rows, 0, batch_size=1000, columns=['id', 'text'])
+    chunk_dir = buffer.chunks[0][0]
+
+    # One long value must not pad every other row to its width
+    assert os.path.getsize(os.path.join(chunk_dir, '1.npy')) < 5000 + 1000 + 1024
+    result = pd.concat(list(buffer.iter_batches()), ignore_index=True)
+    assert result['text'].tolist() == [row[1] for row in rows]
+    buffer.close()
+
+
+@pytest.mark.parametrize('budget', [1 << 30, 20000])
+@pytest.mark.parametrize('ascending', [True, False])
+def test_sort_puts_nulls_last(monkeypatch, rows, budget, ascending):
+    monkeypatch.setattr(result_buffer, 'FETCH_BATCH_SIZE', 700)
+    monkeypatch.setattr(result_buffer, 'MERGE_SLICE_ROWS', 128)
+    buffer = make_buffer(rows, budget)
+
+    result = pd.concat(list(buffer.iter_batches(sort_by='parent_id', ascending=ascending)), ignore_index=True)
+    values = as_values(result, 'parent_id')
+    present = [value for value in values if value is not None]
+
+    assert len(result) == len(rows)
+    assert present == sorted(present, reverse=not ascending)
+    assert values[len(present):] == [None] * (len(values) - len(present))
+    # Ties keep fetch order
+    expected_ids = sorted(
+        (row for row in rows if row[5] is not None),
+        key=lambda row: -row[5] if not ascending else row[5]
+    )
+    assert as_values(result, 'id')[:len(present)] == [row[0] for row in expected_ids]
+    buffer.close()
+
+
+@pytest.mark.parametrize('ascending', [True, False])
+def test_external_sort_merges_in_passes(monkeypatch, rows, ascending):
+    monkeypatch.setattr(result_buffer, 'MAX_MERGE_FAN_IN', 3)
+    monkeypatch.setattr(result_buffer, 'FETCH_BATCH_SIZE', 400)
+    buffer = make_buffer(rows, 0, batch_size=100)
+    assert len(buffer.chunks) == 25
+
+    result = pd.concat(list(buffer.iter_batches(sort_by='id', ascending=ascending)), ignore_index=True)
+    assert as_values(result, 'id') == sorted((row[0] for row in rows), reverse=not ascending)
+    assert as_values(result, 'amount') == [row[1] for row in sorted(rows, key=lambda row: row[0], reverse=not ascending)]
+    # Only the original chunks are left on disk
+    assert len(os.listdir(buffer.spill_dir)) == 25
+    buffer.close()
+
+
+def test_in_memory_sort_keeps_batches_bounded(monkeypatch, rows):
+    monkeypatch.setattr(result_buffer, 'FETCH_BATCH_SIZE', 333)
+    buffer = make_buffer(rows, 1 << 30)
+
+    batches = list(buffer.iter_batches(sort_by='stamp'))
+    assert max(len(batch) for batch in batches) == 333
+    values = as_values(pd.concat(batches, ignore_index=True), 'stamp')
+    present = [value for value in values if value is not None]
+    assert present == sorted(present) and values[len(present):] == [None] * (len(values) - len(present))
+
+
+def test_hash_set_matches_python_set():
+    generator = np.random.default_rng(7)
+    hash_set, expected = HashSet(), set()
+    for _ in range(50):
+        hashes = generator.integers(0, 5000, size=300).astype(np.uint64)
+        mask = hash_set.add_new(hashes)
+
+        expected_mask = np.zeros(len(hashes), dtype=bool)
+        for i, value in enumerate(hashes.tolist()):
+            if value not in expected:
+                expected.add(value)
+                expected_mask[i] = True
+        assert mask.tolist() == expected_mask.tolist()
+    assert len(hash_set) == len(expected)
+
+
+def test_hash_set_work_grows_n_log_n():
+    generator = np.random.default_rng(11)
+    batch, batches = 10000, 200
+    hash_set = HashSet()
+    for _ in range(batches):
+        hash_set.add_new(generator.integers(0, 2 ** 63, size=batch, dtype=np.uint64))
+
+    total = batch * batches
+    levels = math.log2(batches) + 1
+    # A re-sort of everything seen per batch (the old approach) would copy ~total * batches / 2 hashes
+    assert hash_set.merged_items <= total * levels
+    assert len(hash_set.runs) <= levels
+    assert len(hash_set) == total
+
+
+@pytest.mark.parametrize('budget', [1 << 30, 0])
+def test_deduplicate_keeps_first_occurrence(budget):
+    rows = [(i % 10, f"v{i % 10}") for i in range(55)]
+    buffer = make_buffer(rows, budget, batch_size=7, columns=['id', 'value'])
+
+    result = pd.concat(list(buffer.iter_batches(deduplicate=True)), ignore_index=True)
+    assert as_values(result, 'id') == list(range(10))
+    buffer.close()
+
+
+def test_normalize_as_text_ignores_null_float_coercion():
+    with_null = pd.DataFrame({'id': [1, 2], 'value': [5, None]})
+    without_null = pd.DataFrame({'id': [1, 2], 'value': [5, 9]})
+    assert with_null['value'].dtype == 'float64'
+
+    assert normalize_as_text(with_null).values.tolist() == [['1', '5'], ['2', '']]
+    assert normalize_as_text(without_null).iloc[0].tolist() == ['1', '5']
+    assert normalize_as_text(pd.DataFrame({'value': [0.5]})).iloc[0, 0] == '0.5'